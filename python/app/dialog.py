@@ -13,6 +13,9 @@ import os
 import sys
 import re
 import time
+import json
+import logging
+import collections
 
 # by importing QT from sgtk rather than directly, we ensure that
 # the code will be compatible with both PySide and PyQt.
@@ -22,6 +25,131 @@ from .ui.dialog import Ui_Dialog
 # standard toolkit logger
 logger = sgtk.platform.get_logger(__name__)
 
+# Snapshot of the comp values used to work out frame ranges, so they can be fetched for every
+# render queue item in one bridge call. Mirrors the attribute names of a CompItem
+CompTiming = collections.namedtuple(
+    "CompTiming",
+    "id frameRate frameDuration displayStartFrame displayStartTime duration workAreaStart workAreaDuration name",
+)
+
+# Start and end time of a render, in seconds
+FrameRange = collections.namedtuple("FrameRange", "start end")
+
+# Separator for the debug reports
+_BANNER = "*" * 50
+
+# EntityName _ Name _v VersionNumber FileExtension
+_FILENAME_RE = re.compile(r'(.*)_(.*)_v(\d{3})(.*)')
+# Assumed pattern is {Digits}{NonDigitSeperator}{Digits} - e.g. 1001-1002
+_FRAME_RANGE_RE = re.compile(r'(\d+)(\D+)(\d+)')
+# Everything before the first . of a file name
+_FIRSTSEG_RE = re.compile(r'([^.]+)')
+
+# ExtendScript snippets evaluated host-side through AppDialog._jsx. Each one does its
+# enumeration inside After Effects so a lookup costs a single bridge round trip.
+# Arguments are substituted as JSON literals, so avoid bare % characters in the source.
+
+# Makes sure the output module template exists. If it doesn't, the preset project is imported (unless
+# it is already in the project), the template is saved from its PRESET render queue item and the
+# imported folder is removed again. Returns false if the preset project has no PRESET item
+ENSURE_TEMPLATE_JSX = """(function (compId, templateName, presetPath, presetFolderName) {
+    var project = app.project;
+    var renderQueue = project.renderQueue;
+    var i;
+
+    // Add the comp to the render queue just to get at the list of output module templates
+    var renderQueueItem = renderQueue.items.add(project.itemByID(compId));
+    var templates = renderQueueItem.outputModule(renderQueueItem.numOutputModules).templates;
+    renderQueueItem.remove();
+    for (i = 0; i < templates.length; i++) {
+        if (templates[i] === templateName) {
+            return true;
+        }
+    }
+
+    // Imported projects land in a folder named after the project file
+    var importedProject = null;
+    for (i = 1; i <= project.numItems; i++) {
+        var item = project.item(i);
+        if (item instanceof FolderItem && item.name === presetFolderName) {
+            importedProject = item;
+            break;
+        }
+    }
+    if (importedProject === null) {
+        importedProject = project.importFile(new ImportOptions(new File(presetPath)));
+    }
+
+    for (i = 1; i <= renderQueue.numItems; i++) {
+        var presetRenderQueueItem = renderQueue.item(i);
+        if (presetRenderQueueItem.comp.name === "PRESET") {
+            presetRenderQueueItem.outputModule(presetRenderQueueItem.numOutputModules).saveAsTemplate(templateName);
+            importedProject.remove();
+            return true;
+        }
+    }
+    return false;
+})(%s, %s, %s, %s)"""
+
+# Applies the template, time span and output file to each render queue item in the list of updates,
+# leaving the template and output file alone when they already match.
+# Returns the names of the comps that failed, separated by new lines
+APPLY_RENDER_QUEUE_ITEMS_JSX = """(function (updates, templateName) {
+    var renderQueue = app.project.renderQueue;
+    var failed = [];
+    for (var i = 0; i < updates.length; i++) {
+        var update = updates[i];
+        var renderQueueItem = renderQueue.item(update.index);
+        try {
+            var outputModule = renderQueueItem.outputModule(renderQueueItem.numOutputModules);
+            // Applying a template is expensive, skip it if the output module already uses it
+            if (outputModule.name !== templateName) {
+                outputModule.applyTemplate(templateName);
+            }
+            renderQueueItem.timeSpanStart = update.timeSpanStart;
+            renderQueueItem.timeSpanDuration = update.timeSpanDuration;
+            var outputFile = new File(update.output);
+            if (!outputModule.file || outputModule.file.fsName !== outputFile.fsName) {
+                outputModule.file = outputFile;
+            }
+        } catch (e) {
+            failed.push(renderQueueItem.comp.name);
+        }
+    }
+    return failed.join("\\n");
+})(%s, %s)"""
+
+# Returns one line per NEEDS_OUTPUT and QUEUED render queue item, holding the item index followed by
+# the CompTiming fields of its comp, separated by tabs. The comp name goes last so it can contain tabs
+PENDING_RENDER_QUEUE_ITEMS_JSX = """(function () {
+    var renderQueue = app.project.renderQueue;
+    var lines = [];
+    for (var i = 1; i <= renderQueue.numItems; i++) {
+        var renderQueueItem = renderQueue.item(i);
+        var status = renderQueueItem.status;
+        if (status === RQItemStatus.NEEDS_OUTPUT || status === RQItemStatus.QUEUED) {
+            var comp = renderQueueItem.comp;
+            lines.push([
+                i, comp.id, comp.frameRate, comp.frameDuration, comp.displayStartFrame, comp.displayStartTime,
+                comp.duration, comp.workAreaStart, comp.workAreaDuration, comp.name
+            ].join("\\t"));
+        }
+    }
+    return lines.join("\\n");
+})()"""
+
+# Returns the ids of the selected comps as a comma separated string
+SELECTED_COMP_IDS_JSX = """(function () {
+    var selection = app.project.selection;
+    var ids = [];
+    for (var i = 0; i < selection.length; i++) {
+        if (selection[i] instanceof CompItem) {
+            ids.push(selection[i].id);
+        }
+    }
+    return ids.join(",");
+})()"""
+
 
 def show_dialog(app_instance):
     """
@@ -44,6 +172,10 @@ class AppDialog(QtGui.QWidget):
     COMP_TEXT = 'Comp frame range'
     WORK_AREA_TEXT = 'Work area frame range'
 
+    # Resolved presets shared across dialog launches, stored as
+    # (render_presets setting, {name: resolved path}, [names in order])
+    _preset_cache = None
+
     def __init__(self):
         """
         Constructor
@@ -72,44 +204,39 @@ class AppDialog(QtGui.QWidget):
         self.first_frame = self._app.get_setting('default_first_frame')
         self.last_frame = self._app.get_setting('default_last_frame')
 
+        # Output folders already created by this dialog, so they aren't checked again
+        self._created_folders = set()
+
         # lastly, set up our very basic UI
         # self.ui.context.setText("Current Context: %s" % self._app.context)
         self.populate_widgets()
         self.connect_signals_and_slots()
 
     def get_selected_comps(self):
-        comps = []
+        """
+            Get the comps currently selected in the project panel
+
+            :returns: A list of the selected comps
+        """
+        # project.selection returns read only objects with reduced properties when accessed
+        # through the bridge, so filter it host-side and look the comps up again by id
+        result = self._jsx(SELECTED_COMP_IDS_JSX)
+        if not result:
+            return []
 
-        # Have to search through all items in the scene because simply calling
-        # project.selection returns read only objects with reduced properties
-        # Loop through the items in the project
+        project = self.adobe.app.project
+        return [project.itemByID(int(item_id)) for item_id in result.split(",")]
 
-        # TODO: Remove this at a later date
-        # Get the selected items array
-        # This doesn't work as expected
-        #item_array = self.adobe.app.project.selection
-        #array_length = len(item_array)
-        #logger.debug("Array Length: %s" % array_length)
-        # Loop through the items in the array and check if they are comps
-        #for i in range(1, array_length+1):
-        #    theItem = item_array[i]
-        #    logger.debug("Item: %s" % theItem)
-        #    if theItem.data['instanceof'] == 'CompItem':
-        #        comps.append(theItem)
-
-        item_collection = self.adobe.app.project.items
-        for item in self._app.engine.iter_collection(item_collection):
-            # Check if the item is selected and is a comp
-            if item.selected and self._app.engine.is_item_of_type(item, "CompItem"):
-                comps.append(item)
-
-        # Initial implementation TODO: Remove this at a later date
-        #for i in range(1, self.adobe.app.project.numItems+1):
-        #    theItem = self.adobe.app.project.item(i)
-        #    if theItem.data['instanceof'] == 'CompItem' and theItem.selected:
-        #        comps.append(theItem)
-
-        return comps
+    def _jsx(self, script, *args):
+        """
+            Evaluate an ExtendScript snippet inside After Effects in a single bridge call
+
+            :param script: The ExtendScript source, with a %s placeholder per argument
+            :param args: The arguments to substitute, encoded as JSON literals
+
+            :returns: The value returned by the script
+        """
+        return self.adobe.rpc_eval(script % tuple(json.dumps(arg) for arg in args))
 
     def populate_widgets(self):
         """
@@ -129,19 +256,38 @@ class AppDialog(QtGui.QWidget):
         """
             Populate the frame range combo box with the default options
         """
-        self.ui.frameRangeComboBox.insertItems(0, [self.COMP_TEXT, self.WORK_AREA_TEXT, self.CUSTOM_TEXT])
+        # Block signals so populating doesn't fire currentIndexChanged for every item
+        comboBox = self.ui.frameRangeComboBox
+        comboBox.blockSignals(True)
+        comboBox.insertItems(0, [self.COMP_TEXT, self.WORK_AREA_TEXT, self.CUSTOM_TEXT])
+        comboBox.blockSignals(False)
         self.ui.frameRangeLineEdit.setEnabled(False)
 
     def populate_presets(self):
         """
             Populate the render format dropdown with the available presets
         """
-        self.presets = {}
-        for preset_item in self._app.get_setting("render_presets"):
-            # use an internal method to resolve the path of the ae template files
-            resolved_path = self._app._TankBundle__resolve_hook_expression(preset_item['name'], preset_item['path'])
-            self.presets[preset_item['name']] = resolved_path[0]
-            self.ui.renderFormatDropdown.insertItems(-1, [preset_item['name']])
+        render_presets = tuple(
+            (preset_item['name'], preset_item['path']) for preset_item in self._app.get_setting("render_presets")
+        )
+
+        # Only resolve the presets again if the setting has changed since the last launch
+        if AppDialog._preset_cache is None or AppDialog._preset_cache[0] != render_presets:
+            resolved_presets = {}
+            for name, path in render_presets:
+                # use an internal method to resolve the path of the ae template files
+                resolved_path = self._app._TankBundle__resolve_hook_expression(name, path)
+                resolved_presets[name] = resolved_path[0]
+
+            AppDialog._preset_cache = (render_presets, resolved_presets, [name for name, _ in render_presets])
+
+        _, resolved_presets, preset_names = AppDialog._preset_cache
+        self.presets = dict(resolved_presets)
+
+        dropdown = self.ui.renderFormatDropdown
+        dropdown.blockSignals(True)
+        dropdown.insertItems(-1, preset_names)
+        dropdown.blockSignals(False)
 
     def connect_signals_and_slots(self):
         """
@@ -169,7 +315,7 @@ class AppDialog(QtGui.QWidget):
         # Get the selected comps
         # Debugging time stamp for testing HH:MM:SS
         self.start_time = time.time()
-        logger.debug("Start Render Queue Items Time: %s" % time.strftime("%H:%M:%S"))
+        logger.debug("Start Render Queue Items Time: %s", time.strftime("%H:%M:%S"))
 
         if add_active:
             selected_comps = [self.adobe.app.project.activeItem]
@@ -186,8 +332,8 @@ class AppDialog(QtGui.QWidget):
         # TODO: Remove this at a later date
         # Keeping for reference
 
-        logger.debug("Selected comps: %s" % selected_comps)
-        logger.debug("Selected comps: %s" % len(selected_comps))
+        logger.debug("Selected comps: %s", selected_comps)
+        logger.debug("Selected comps: %s", len(selected_comps))
 
         # Check if any comps are selected
         if len(selected_comps) == 0:
@@ -200,28 +346,37 @@ class AppDialog(QtGui.QWidget):
             self.alert_box("Error", "Failed to find selected render preset")
             return
 
+        # The output location and project version are the same for every comp, so only look them up once
+        name, version = self.get_project_name_and_version()
+        outputLocation = self.get_shotgrid_template(render_queue_template, name, version)
+        if not self.ui.useCompNameCheckBox.isChecked():
+            version = None
+
+        frameRangeMode = self.ui.frameRangeComboBox.currentText()
+        frameRangeText = self.ui.frameRangeLineEdit.text()
+
         # Suppress dialogs
         self.adobe.app.beginSuppressDialogs()
 
         for comp in selected_comps:
 
             # Get the frame range to render
-            frame_range = self.get_frame_range(comp)
-            if frame_range[0] is None or frame_range[1] is None:
-                logger.debug("Bad frame range, skipping %s" % comp.name)
+            frame_range = self.get_frame_range(comp, frameRangeMode, frameRangeText)
+            if frame_range.start is None or frame_range.end is None:
+                logger.debug("Bad frame range, skipping %s", comp.name)
                 self.alert_box("Bad frame range", "Please check the frame range for %s, Skipping" % comp.name)
-                pass
+                continue
 
             # Create a render queue item for each of the selected comps
-            self.create_render_queue_item_for_comp(comp, frame_range, render_queue_template)
+            self.create_render_queue_item_for_comp(comp, frame_range, render_queue_template, outputLocation, version)
             count += 1
 
         # End Suppress Dialogs
         self.adobe.app.endSuppressDialogs()
 
         # Debugging time stamp for testing HH:MM:SS
-        logger.debug("Finish Time: %s" % time.strftime("%H:%M:%S"))
-        logger.debug("Total Time: %s" % (time.time() - self.start_time))
+        logger.debug("Finish Time: %s", time.strftime("%H:%M:%S"))
+        logger.debug("Total Time: %s", time.time() - self.start_time)
 
         self.message_box( 'Add Comps To Render Queue', 'Successfully Added %d comps to the render queue' % count)
         self.close()
@@ -235,91 +390,166 @@ class AppDialog(QtGui.QWidget):
         # Get the selected comps
         # Debugging time stamp for testing HH:MM:SS
         self.start_time = time.time()
-        logger.debug("Start Render Queue Items Time: %s" % time.strftime("%H:%M:%S"))
+        logger.debug("Start Render Queue Items Time: %s", time.strftime("%H:%M:%S"))
 
         logger.debug("Applying to render queue items")
-        render_queue = self.adobe.app.project.renderQueue
-
-        # Get render queue items
-        render_queue_items = self.adobe.app.project.renderQueue.items
-        logger.debug("Render Queue Items: %s" % render_queue_items)
-
-        # Filter out the render queue items by status
+        # Filter out the render queue items by status host-side
         # Should only include items that match NEEDS_OUTPUT and QUEUED
-        filtered_render_queue_items = []
-        for i in range(1, render_queue.numItems+1):
-            render_queue_item = self.adobe.app.project.renderQueue.item(i)
-            logger.debug("Render Queue Item: %s" % render_queue_item)
-            logger.debug("Render Queue Item Status: %s" % render_queue_item.status)
-
-            # Status codes
-            # 3013 = NEEDS_OUTPUT, 3015 = QUEUED
-            if render_queue_item.status == 3013 or render_queue_item.status == 3015:
-                filtered_render_queue_items.append(render_queue_item)
+        pending = self.get_pending_render_queue_items()
+        logger.debug("Pending Render Queue Items: %s", [index for index, _ in pending])
 
         # Check if any render queue items are selected
-        if len(filtered_render_queue_items) == 0:
+        if len(pending) == 0:
             self.alert_box("No render queue items meet the criteria", "Please add some render queue items to apply the changes to")
             return
 
         logger.debug("Getting render queue template")
-        count = 0
         render_queue_template = self.get_render_queue_template()
         if render_queue_template is None:
             self.alert_box("Error", "Failed to find selected render preset")
             return
 
-        for item in filtered_render_queue_items:
-            # Get the comp for the render queue item
-            comp = item.comp
-            # Get the frame range to render
-            frame_range = self.get_frame_range(comp)
-            if frame_range[0] is None or frame_range[1] is None:
-                logger.debug("Bad frame range, skipping %s" % comp.name)
-                self.alert_box("Bad frame range", "Please check the frame range for %s, Skipping" % comp.name)
-                pass
+        templateName = self.ui.renderFormatDropdown.currentText()
 
-            # Update the render queue item
-            self.update_render_queue_item(comp, item, frame_range, render_queue_template)
-            count += 1
+        # Work out the new settings for every item first, then apply them all in one host-side call
+        updates = self.gather_render_queue_item_updates(pending, render_queue_template, templateName)
+        count = self.apply_render_queue_item_updates(updates, render_queue_template, templateName)
 
         # Debugging time stamp for testing HH:MM:SS
-        logger.debug("Finish Time: %s" % time.strftime("%H:%M:%S"))
-        logger.debug("Total Time: %s" % (time.time() - self.start_time))
+        logger.debug("Finish Time: %s", time.strftime("%H:%M:%S"))
+        logger.debug("Total Time: %s", time.time() - self.start_time)
 
         self.message_box( 'Apply To Render Queue Items', 'Successfully updated %d render queue items' % count)
         self.close()
 
-    def get_frame_range(self, comp):
+    def get_pending_render_queue_items(self):
+        """
+            Get the render queue items that need output or are queued, along with their comp timings
+
+            :returns: A list of (render queue index, CompTiming) tuples
+        """
+        result = self._jsx(PENDING_RENDER_QUEUE_ITEMS_JSX)
+        if not result:
+            return []
+
+        pending = []
+        for line in result.split("\n"):
+            values = line.split("\t", len(CompTiming._fields))
+            comp = CompTiming(
+                id=int(values[1]),
+                frameRate=float(values[2]),
+                frameDuration=float(values[3]),
+                displayStartFrame=int(values[4]),
+                displayStartTime=float(values[5]),
+                duration=float(values[6]),
+                workAreaStart=float(values[7]),
+                workAreaDuration=float(values[8]),
+                name=values[9],
+            )
+            pending.append((int(values[0]), comp))
+
+        return pending
+
+    def gather_render_queue_item_updates(self, pending, render_queue_template, templateName):
+        """
+            Work out the new settings for each render queue item without changing anything in the render queue
+
+            :param pending: The (render queue index, CompTiming) tuples of the items to update
+            :param render_queue_template: The template to use for the render queue items
+            :param templateName: The name of the output module template
+
+            :returns: A list of updates, as expected by APPLY_RENDER_QUEUE_ITEMS_JSX
+        """
+        # Every item gets the same template, so only check it exists once
+        if not self.check_template_exists(pending[0][1], render_queue_template, templateName):
+            self.alert_box("Error", "Something went wrong applying or locating an output template")
+
+        # The output location and project version are the same for every item, so only look them up once
+        name, version = self.get_project_name_and_version()
+        outputLocation = self.get_shotgrid_template(render_queue_template, name, version)
+        if not self.ui.useCompNameCheckBox.isChecked():
+            version = None
+
+        frameRangeMode = self.ui.frameRangeComboBox.currentText()
+        frameRangeText = self.ui.frameRangeLineEdit.text()
+
+        updates = []
+        for index, comp in pending:
+            # The comp values were all fetched up front, so nothing here crosses the bridge
+            compName = comp.name
+            # Get the frame range to render
+            frame_range = self.get_frame_range(comp, frameRangeMode, frameRangeText)
+            if frame_range.start is None or frame_range.end is None:
+                logger.debug("Bad frame range, skipping %s", compName)
+                self.alert_box("Bad frame range", "Please check the frame range for %s, Skipping" % compName)
+                continue
+
+            # Use the comp's own durations as-is, end minus start can be off by a rounding error
+            if frameRangeMode == self.COMP_TEXT:
+                duration = comp.duration
+            elif frameRangeMode == self.WORK_AREA_TEXT:
+                duration = comp.workAreaDuration
+            else:
+                duration = frame_range.end - frame_range.start
+
+            updates.append(
+                self.get_render_queue_item_update(compName, index, frame_range, duration, outputLocation, version)
+            )
+
+        return updates
+
+    def apply_render_queue_item_updates(self, updates, render_queue_template, templateName):
+        """
+            Apply the updates to the render queue items in a single host-side call
+
+            :param updates: The updates from gather_render_queue_item_updates
+            :param render_queue_template: The template to use for the render queue items
+            :param templateName: The name of the output module template
+
+            :returns: The number of render queue items that were updated
+        """
+        failed = self._jsx(APPLY_RENDER_QUEUE_ITEMS_JSX, updates, templateName)
+        if not failed:
+            return len(updates)
+
+        self.alert_box("Error",
+                       "There's some kind of issue with this template\n\n" + str(templateName) + '\n' + str(
+                           render_queue_template) + "\n\nFailed to update:\n" + failed)
+        return len(updates) - len(failed.split("\n"))
+
+    def get_frame_range(self, comp, frameRangeMode, frameRangeText):
         """
             Get the frame range to render
 
-            :param comp: The comp to get the frame range for
+            :param comp: The comp, or CompTiming of the comp, to get the frame range for
+            :param frameRangeMode: The selected frame range option
+            :param frameRangeText: The custom frame range text
 
-            :returns: A list containing the start and end frame to render
+            :returns: A FrameRange with the start and end time to render
         """
         startFrame = None
         endFrame = None
 
-        # Debug Info Report for Comp
-        try:
-            logger.debug("*" * 50)
-            logger.debug(" Debug Info Report for Comp")
-            logger.debug("*" * 50)
-            logger.debug("Comp Name: %s" % comp.name)
-            logger.debug("Comp Frame Rate: %s" % comp.frameRate)
-            logger.debug("Comp Frame Duration: %s" % comp.frameDuration)
-            logger.debug("Comp Display Start Frame: %s" % comp.displayStartFrame)
-            logger.debug("Comp Display Start Time: %s" % comp.displayStartTime)
-            logger.debug("Comp Duration: %s" % comp.duration)
-            logger.debug("Comp Work Area Start: %s" % comp.workAreaStart)
-            logger.debug("Comp Work Area Duration: %s" % comp.workAreaDuration)
-            logger.debug("*" * 50)
-        except Exception as e:
-            logger.debug("Failed to get debug info for comp: %s" % e)
+        # Debug Info Report for Comp, skipped unless debugging as every read is a bridge round trip
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                logger.debug(_BANNER)
+                logger.debug(" Debug Info Report for Comp")
+                logger.debug(_BANNER)
+                logger.debug("Comp Name: %s", comp.name)
+                logger.debug("Comp Frame Rate: %s", comp.frameRate)
+                logger.debug("Comp Frame Duration: %s", comp.frameDuration)
+                logger.debug("Comp Display Start Frame: %s", comp.displayStartFrame)
+                logger.debug("Comp Display Start Time: %s", comp.displayStartTime)
+                logger.debug("Comp Duration: %s", comp.duration)
+                logger.debug("Comp Work Area Start: %s", comp.workAreaStart)
+                logger.debug("Comp Work Area Duration: %s", comp.workAreaDuration)
+                logger.debug(_BANNER)
+            except Exception as e:
+                logger.debug("Failed to get debug info for comp: %s", e)
 
         # Use comp frame range (This is purely for debugging purposes)
-        if self.ui.frameRangeComboBox.currentText() == self.COMP_TEXT:
+        if frameRangeMode == self.COMP_TEXT:
             logger.debug("Using comp frame range")
             # Get the start and end frame
             startFrame = 0
@@ -328,30 +558,33 @@ class AppDialog(QtGui.QWidget):
             ############################
             # Debugging info
             ############################
-            logger.debug("Start Time: %s" % startFrame)
-            logger.debug("End Time: %s" % endFrame)
+            logger.debug("Start Time: %s", startFrame)
+            logger.debug("End Time: %s", endFrame)
 
-            # Convert to frame numbers
-            # Check if the comp work area has a start frame of 0
-            logger.debug("Checking if start time is 0")
-            if int(startFrame) == 0:
-                startFrameNum = comp.displayStartFrame
+            # Convert to frame numbers, only needed for the debug log
+            if logger.isEnabledFor(logging.DEBUG):
+                frameDuration = comp.frameDuration
+                displayStartFrame = comp.displayStartFrame
+                # Check if the comp work area has a start frame of 0
+                logger.debug("Checking if start time is 0")
+                if int(startFrame) == 0:
+                    startFrameNum = displayStartFrame
 
-            else:
-                startFrameNum = int(round((startFrame / comp.frameDuration))) + comp.displayStartFrame
+                else:
+                    startFrameNum = int(round((startFrame / frameDuration))) + displayStartFrame
 
-            # Start frame
-            logger.debug("Start Frame: %s" % startFrameNum)
+                # Start frame
+                logger.debug("Start Frame: %s", startFrameNum)
 
-            # End frame
-            endFrameNum = int(round((endFrame / comp.frameDuration))) + comp.displayStartFrame
-            logger.debug("End Frame: %s" % endFrameNum)
+                # End frame
+                endFrameNum = int(round((endFrame / frameDuration))) + displayStartFrame
+                logger.debug("End Frame: %s", endFrameNum)
 
             #endFrame = int(comp.frameRate * comp.workAreaDuration)
             #endFrame = int(comp.frameRate * comp.duration + 0.0001)
 
         # Use work area frame range (This is purely for debugging purposes)
-        elif self.ui.frameRangeComboBox.currentText() == self.WORK_AREA_TEXT:
+        elif frameRangeMode == self.WORK_AREA_TEXT:
             logger.debug("Using work area frame range")
             startFrame = comp.workAreaStart
             endFrame = (startFrame + comp.workAreaDuration)
@@ -359,40 +592,46 @@ class AppDialog(QtGui.QWidget):
             ############################
             # Debugging info
             ############################
-            logger.debug("Start Time: %s" % startFrame)
-            logger.debug("End Time: %s" % endFrame)
+            logger.debug("Start Time: %s", startFrame)
+            logger.debug("End Time: %s", endFrame)
 
-            # Convert to frame numbers
-            startFrameNum = int(round((startFrame / comp.frameDuration))) + comp.displayStartFrame
-            endFrameNum = int(round((endFrame / comp.frameDuration))) + comp.displayStartFrame
+            # Convert to frame numbers, only needed for the debug log
+            if logger.isEnabledFor(logging.DEBUG):
+                frameDuration = comp.frameDuration
+                displayStartFrame = comp.displayStartFrame
+                startFrameNum = int(round((startFrame / frameDuration))) + displayStartFrame
+                endFrameNum = int(round((endFrame / frameDuration))) + displayStartFrame
 
-            # Start frame
-            logger.debug("Start Frame: %s" % startFrameNum)
+                # Start frame
+                logger.debug("Start Frame: %s", startFrameNum)
 
-            # End frame
-            logger.debug("End Frame: %s" % endFrameNum)
+                # End frame
+                logger.debug("End Frame: %s", endFrameNum)
 
         # Use custom frame range
-        elif self.ui.frameRangeComboBox.currentText() == self.CUSTOM_TEXT:
+        elif frameRangeMode == self.CUSTOM_TEXT:
 
-            rawText = self.ui.frameRangeLineEdit.text()
+            rawText = frameRangeText
             # Assumed pattern is {Digits}{NonDigitSeperator}{Digits} - e.g. 1001-1002
-            match = re.match(r'(\d+)(\D+)(\d+)', rawText)
-            logger.debug("Using custom frame range: %s" % rawText)
+            match = _FRAME_RANGE_RE.match(rawText)
+            logger.debug("Using custom frame range: %s", rawText)
             if match:
-                startFrame = match.group(1)
-                endFrame = match.group(3)
-
-                # Change frame number to Time and calculate the start and end time durations according to the start time
-                logger.debug("Start Frame: %s" % startFrame)
-                startFrame = (comp.frameDuration * int(startFrame)) - comp.displayStartTime
-                logger.debug("Start Time: %s" % startFrame)
-
-                logger.debug("End Frame: %s" % endFrame)
-                endFrame = (comp.frameDuration * int(endFrame)) - comp.displayStartTime + 0.0001 # Add a small amount to ensure the last frame is included to avoid rounding errors
-                logger.debug("End Time: %s" % endFrame)
-
-        return [startFrame, endFrame]
+                # Keep the frame bounds as integer indices and only convert to time once
+                startIdx = int(match.group(1))
+                endIdx = int(match.group(3))
+                frameDuration = comp.frameDuration
+                logger.debug("Start Frame: %s", startIdx)
+                logger.debug("End Frame: %s", endIdx)
+
+                # Offset by the display start frame while still in integer frames, so the first frame
+                # of the comp is exactly 0. The end time is exclusive, so the span covers
+                # (endIdx - startIdx + 1) whole frames and the last frame is included without a rounding fudge
+                startFrame = (startIdx - comp.displayStartFrame) * frameDuration
+                endFrame = startFrame + (endIdx - startIdx + 1) * frameDuration
+                logger.debug("Start Time: %s", startFrame)
+                logger.debug("End Time: %s", endFrame)
+
+        return FrameRange(startFrame, endFrame)
 
     def get_render_queue_template(self):
         """
@@ -430,7 +669,7 @@ class AppDialog(QtGui.QWidget):
             :param title: The title of the warning box
             :param text: The text of the warning box
         """
-        logger.debug("Displaying Warning Box: %s" % text)
+        logger.debug("Displaying Warning Box: %s", text)
         # Display the warning box
         QtGui.QMessageBox.warning(
             self,
@@ -447,7 +686,7 @@ class AppDialog(QtGui.QWidget):
             :param title: The title of the message box
             :param text: The text of the message box
         """
-        logger.debug("Displaying Message Box: %s" % text)
+        logger.debug("Displaying Message Box: %s", text)
         # Display the message box
         QtGui.QMessageBox.information(
             self,
@@ -457,18 +696,20 @@ class AppDialog(QtGui.QWidget):
             defaultButton=QtGui.QMessageBox.Ok,
         )
 
-    def create_render_queue_item_for_comp(self, comp, frame_range, render_queue_template):
+    def create_render_queue_item_for_comp(self, comp, frame_range, render_queue_template, outputLocation, version=None):
         """
             Create a render queue item for each of the selected comps
 
             :param comp: The comp to add to the render queue
             :param frame_range: The frame range to render
             :param render_queue_template: The template to use for the render queue item
+            :param outputLocation: The output location from the shotgrid template
+            :param version: The project version number, if given the output file is renamed after the comp
         """
         templateName = self.ui.renderFormatDropdown.currentText()
 
         # Check the template actually exists
-        if not self.check_template_exists(comp, frame_range, render_queue_template, templateName):
+        if not self.check_template_exists(comp, render_queue_template, templateName):
             self.alert_box("Error", "Something went wrong applying or locating an output template")
 
         renderQueueItem = self.adobe.app.project.renderQueue.items.add(comp)
@@ -491,57 +732,11 @@ class AppDialog(QtGui.QWidget):
             renderQueueItem.timeSpanDuration = comp.workAreaDuration
 
         elif self.ui.frameRangeComboBox.currentText() == self.CUSTOM_TEXT:
-            renderQueueItem.timeSpanStart = frame_range[0]
-            renderQueueItem.timeSpanDuration = frame_range[1] - frame_range[0]
-
-        # Grab the output folder from templates
-        outputLocation = self.get_shotgrid_template(render_queue_template)
-
-        # Create the output folder if it doesn't already exist
-        folderPath = os.path.dirname(outputLocation)
-        if not os.path.exists(folderPath):
-            os.makedirs(folderPath)
-
-        # Debugging
-        logger.debug("Output location: %s" % outputLocation)
-        logger.debug("Output folder: %s" % folderPath)
-        logger.debug("Comp Name: %s" % comp.name)
-
-        # Replace output location with comp name if checkbox is checked
-        if self.ui.useCompNameCheckBox.isChecked():
-            # Get the original output file and strip the folder path
-            originalOutputFile = outputLocation.replace(folderPath, '')
-
-            # Get the filename
-            fileName = self.adobe.app.project.file.name
-
-            # EntityName _ Name _v VersionNumber FileExtension
-            match = re.match(r'(.*)(_)(.*)(_v)(\d\d\d)(.*)', fileName)
-
-            name = match.group(3)
-            version = int(match.group(5))
-
-            # Get the comp name
-            compName = comp.name
-
-            # Join the comp name with the version number
-            newFileName = "%s_v%03d" % (compName, version)
-
-            # Replace the first group before the first . with the comp name
-            newOutputFile = re.sub(r'([^.]+)', newFileName, originalOutputFile, 1)
-
-            #Debugging
-            logger.debug("Original Output File: %s" % originalOutputFile)
-            logger.debug("New Output File: %s" % newOutputFile)
-
-            # Rebuild the output location
-            outputLocation = os.path.join(folderPath, compName, newOutputFile)
-            logger.debug("Output location: %s" % outputLocation)
+            renderQueueItem.timeSpanStart = frame_range.start
+            renderQueueItem.timeSpanDuration = frame_range.end - frame_range.start
 
-            # Create the output folder if it doesn't already exist
-            folderPath = os.path.dirname(outputLocation)
-            if not os.path.exists(folderPath):
-                os.makedirs(folderPath)
+        # Rename the output after the comp if a version was given
+        outputLocation = self.get_output_location(comp.name, outputLocation, version)
 
         # Set the filepath and name on the newly created output module
         # Do it twice because it sometimes fails the first time - Sean
@@ -549,109 +744,103 @@ class AppDialog(QtGui.QWidget):
         renderQueueItem.outputModule(renderQueueItem.numOutputModules).file = self.adobe.File(outputLocation)
 
         # Log
-        logger.debug("Comp: %s has been added to the render queue" % comp.name)
+        logger.debug("Comp: %s has been added to the render queue", comp.name)
         self.adobe.app.endSuppressDialogs(alert=False)
 
-    def update_render_queue_item(self, comp, render_queue_item, frame_range, render_queue_template):
+    def get_render_queue_item_update(self, compName, index, frame_range, duration, outputLocation, version=None):
         """
-            Update the render queue item with the new settings
+            Get the new settings for a render queue item
 
-            :param comp: The comp to add to the render queue
-            :param render_queue_item: The render queue item to update
+            :param compName: The name of the comp of the render queue item
+            :param index: The index of the render queue item in the render queue
             :param frame_range: The frame range to render
-            :param render_queue_template: The template to use for the render queue item
+            :param duration: The duration of the time span to render
+            :param outputLocation: The output location from the shotgrid template
+            :param version: The project version number, if given the output file is renamed after the comp
 
+            :returns: A dictionary describing the update, as expected by APPLY_RENDER_QUEUE_ITEMS_JSX
         """
+        return {
+            "index": index,
+            "timeSpanStart": frame_range.start,
+            "timeSpanDuration": duration,
+            "output": self.get_output_location(compName, outputLocation, version),
+        }
 
-        templateName = self.ui.renderFormatDropdown.currentText()
-
-        # Check the template actually exists
-        if not self.check_template_exists(comp, frame_range, render_queue_template, templateName):
-            self.alert_box("Error", "Something went wrong applying or locating an output template")
-
-        try:
-            render_queue_item.outputModule(render_queue_item.numOutputModules).applyTemplate(templateName)
-        except:
-            self.alert_box("Error",
-                           "There's some kind of issue with this template\n\n" + str(templateName) + '\n' + str(
-                               render_queue_template))
-            return
-
-        # Set the render to the start/end times
-        if self.ui.frameRangeComboBox.currentText() == self.COMP_TEXT:
-            render_queue_item.timeSpanStart = 0
-            render_queue_item.timeSpanDuration = comp.duration
-
-        elif self.ui.frameRangeComboBox.currentText() == self.WORK_AREA_TEXT:
-            render_queue_item.timeSpanStart = comp.workAreaStart
-            render_queue_item.timeSpanDuration = comp.workAreaDuration
-
-        elif self.ui.frameRangeComboBox.currentText() == self.CUSTOM_TEXT:
-            render_queue_item.timeSpanStart = frame_range[0]
-            render_queue_item.timeSpanDuration = frame_range[1] - frame_range[0]
+    def get_output_location(self, compName, outputLocation, version=None):
+        """
+            Get the output location for a comp and make sure its folder exists
 
-        # Grab the output folder from templates
-        outputLocation = self.get_shotgrid_template(render_queue_template)
+            :param compName: The name of the comp
+            :param outputLocation: The output location from the shotgrid template
+            :param version: The project version number, if given the output file is renamed after the comp
 
+            :returns: The output location for the comp
+        """
         # Create the output folder if it doesn't already exist
         folderPath = os.path.dirname(outputLocation)
-        if not os.path.exists(folderPath):
-            os.makedirs(folderPath)
+        self.create_folder(folderPath)
 
         # Debugging
-        logger.debug("Output location: %s" % outputLocation)
-        logger.debug("Output folder: %s" % folderPath)
-        logger.debug("Comp Name: %s" % comp.name)
+        logger.debug("Output location: %s", outputLocation)
+        logger.debug("Output folder: %s", folderPath)
+        logger.debug("Comp Name: %s", compName)
 
         # Replace output location with comp name if checkbox is checked
-        if self.ui.useCompNameCheckBox.isChecked():
+        if version is not None:
             # Get the original output file and strip the folder path
             originalOutputFile = outputLocation.replace(folderPath, '')
 
-            # Get the filename
-            fileName = self.adobe.app.project.file.name
-
-            # EntityName _ Name _v VersionNumber FileExtension
-            match = re.match(r'(.*)(_)(.*)(_v)(\d\d\d)(.*)', fileName)
-
-            name = match.group(3)
-            version = int(match.group(5))
-
-            # Get the comp name
-            compName = comp.name
-
             # Join the comp name with the version number
             newFileName = "%s_v%03d" % (compName, version)
 
             # Replace the first group before the first . with the comp name
-            newOutputFile = re.sub(r'([^.]+)', newFileName, originalOutputFile, 1)
+            newOutputFile = _FIRSTSEG_RE.sub(newFileName, originalOutputFile, count=1)
 
             # Debugging
-            logger.debug("Original Output File: %s" % originalOutputFile)
-            logger.debug("New Output File: %s" % newOutputFile)
+            logger.debug("Original Output File: %s", originalOutputFile)
+            logger.debug("New Output File: %s", newOutputFile)
 
             # Rebuild the output location
             outputLocation = os.path.join(folderPath, compName, newOutputFile)
-            logger.debug("Output location: %s" % outputLocation)
+            logger.debug("Output location: %s", outputLocation)
 
             # Create the output folder if it doesn't already exist
             folderPath = os.path.dirname(outputLocation)
-            if not os.path.exists(folderPath):
-                os.makedirs(folderPath)
+            self.create_folder(folderPath)
 
-        # Set the filepath and name on the newly created output module
-        # Do it twice because it sometimes fails the first time - Sean
-        render_queue_item.outputModule(render_queue_item.numOutputModules).file = self.adobe.File(outputLocation)
-        render_queue_item.outputModule(render_queue_item.numOutputModules).file = self.adobe.File(outputLocation)
+        return outputLocation
 
-        # Log
-        logger.debug("Render Queue Item for: %s has been updated" % render_queue_item.comp.name)
+    def create_folder(self, folderPath):
+        """
+            Create a folder if it hasn't already been created by this dialog
+
+            :param folderPath: The folder to create
+        """
+        if folderPath not in self._created_folders:
+            os.makedirs(folderPath, exist_ok=True)
+            self._created_folders.add(folderPath)
 
-    def get_shotgrid_template(self, render_queue_template):
+    def get_project_name_and_version(self):
+        """
+            Get the name and version fields from the project file name
+
+            :returns: A tuple of the name and the version number
+        """
+        # EntityName _ Name _v VersionNumber FileExtension
+        match = _FILENAME_RE.match(self.adobe.app.project.file.name)
+        if not match:
+            raise Exception("Couldn't retrieve info from filename, try saving your scene?")
+
+        return match.group(2), int(match.group(3))
+
+    def get_shotgrid_template(self, render_queue_template, name, version):
         """
             Get the output location from the render queue template
 
             :param render_queue_template: The template to use for the render queue item
+            :param name: The name field from the project file name
+            :param version: The version number from the project file name
 
             :returns: The output location for the render queue item
         """
@@ -665,16 +854,8 @@ class AppDialog(QtGui.QWidget):
         # Apply context as base fields
         fields = self._app.context.as_template_fields(template)
 
-        # Grab fields from filename
-        fileName = self.adobe.app.project.file.name
-
-        # EntityName _ Name _v VersionNumber FileExtension
-        match = re.match(r'(.*)(_)(.*)(_v)(\d\d\d)(.*)', fileName)
-        if not match:
-            raise Exception("Couldn't retrieve info from filename, try saving your scene?")
-
-        fields['name'] = match.group(3)
-        fields['version'] = int(match.group(5))
+        fields['name'] = name
+        fields['version'] = version
 
         # Add in a %04d number if it's a sequence then strip it out to be [####] for AE
         if 'SEQ' in template.keys:
@@ -687,73 +868,16 @@ class AppDialog(QtGui.QWidget):
 
         return outputPath
 
-    def check_template_exists(self, comp, frame_range, render_queue_template, templateName):
+    def check_template_exists(self, comp, render_queue_template, templateName):
         """
             Check that the template exists, if not create it
         """
-        # Add the comp to the render queue
-        renderQueueItem = self.adobe.app.project.renderQueue.items.add(comp)
-
-        # If the output module template already exists, just apply it, otherwise import the prest project, save the new template, clean up, and then apply it
-        if templateName in renderQueueItem.outputModule(renderQueueItem.numOutputModules).templates:
-            renderQueueItem.outputModule(renderQueueItem.numOutputModules).applyTemplate(templateName)
-            renderQueueItem.remove()
-            return True
-
-        # Remove the comp from the render
-        renderQueueItem.remove()
-
-        # Import the preset project
-        importedProject = self.importPresetProject(render_queue_template)
-
-        # Get preset render queue item
-        presetRenderQueueItem = self.findRenderQueueItemByCompName('PRESET')
-        if presetRenderQueueItem is None:
-            return False
-
-        presetRenderQueueItem.outputModule(presetRenderQueueItem.numOutputModules).saveAsTemplate(templateName)
-        importedProject.remove()
-
-        return True
-
-    def findRenderQueueItemByCompName(self, comp_name):
-        """
-            Find a render queue item by the comp name
-
-            :param comp_name: The name of the comp to search for
-
-            :returns: The render queue item
-        """
-        renderQueueItems = self.adobe.app.project.renderQueue.items
-        for i in range(1, self.adobe.app.project.renderQueue.numItems+1):
-            if renderQueueItems[i].comp.name == comp_name:
-                return renderQueueItems[i]
-
-        return None
-
-    def importPresetProject(self, render_queue_template):
-        """
-            Import the preset project
-
-            :param render_queue_template: The template to use for the render queue item
-
-            :returns: The imported project
-        """
-        importProjectFolder = None
-
-        for i in range(1, self.adobe.app.project.numItems+1):
-            projectItem = self.adobe.app.project.item(i)
-
-            if projectItem['instanceof'] == 'FolderItem':
-                if projectItem.name == render_queue_template.name:
-                    importProjectFolder = projectItem
-                    break
-
-        if importProjectFolder is None:
-            fileObject = self.adobe.File(render_queue_template)
-            importOptions = self.adobe.ImportOptions()
-            importOptions.file = fileObject
-
-            importProjectFolder = self.adobe.app.project.importFile(importOptions)
-
-        return importProjectFolder
+        # If the output module template already exists there is nothing to do, otherwise import the preset project,
+        # save the new template and clean up. All of it runs host-side in one call
+        return bool(self._jsx(
+            ENSURE_TEMPLATE_JSX,
+            comp.id,
+            templateName,
+            render_queue_template,
+            os.path.basename(render_queue_template),
+        ))